@@ -1,3 +1,8 @@
 # -*- coding: UTF-8 -*-
 from doctrine.code.code import Code, CodeContext
-from doctrine.code.analysis import Analyzer
+from doctrine.code.analysis import Analyzer, register_analyzer, get_analyzer
+from doctrine.code.scheduler import AnalysisScheduler
+from doctrine.code.cache import AnalysisCache
+from doctrine.code.diff import Hunk, diff_rows
+from doctrine.code.layout import Layout
+from doctrine.code.indent import IndentIndex
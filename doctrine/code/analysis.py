@@ -1,12 +1,85 @@
 # -*- coding: UTF-8 -*-
 
+# Analyzers are found per filetype, by registering them with
+# ``register_analyzer`` or as an entry point in this group, with the filetype
+# as the name. Nothing is imported until an analyzer is needed, so that
+# having many plugins installed doesn't make starting up slow.
+ENTRY_POINT_GROUP = 'doctrine.code.analyzers'
+
+_registry = {}  # filetype -> Analyzer class, or a "module:Class" string
+_entry_points = None  # filetype -> entry point, found on first use
+
 
 # I'm not using abc's, because I want to be able for plugins to implement the
 # API only partially.
 
 class Analyzer(object):
+    # How many rows after a block find_block may look at to find where the
+    # block ends. The cache only reuses a block if these are unchanged too.
+    lookahead = 1
+
     def __init__(self, code):
         self.code = code
 
     def find_block(self, start_row, max_block):
         raise NotImplementedError
+
+
+def register_analyzer(filetype, analyzer):
+    """Register an Analyzer class for a filetype.
+
+    The analyzer can also be given as a "module:Class" string, and will then
+    not be imported until it is used.
+    """
+    if not isinstance(analyzer, type):
+        module, _, attrs = analyzer.partition(':')
+        if not module or not attrs:
+            raise ValueError('Analyzer must be a class or a "module:Class" '
+                             'string, not %r' % analyzer)
+    _registry[filetype] = analyzer
+
+
+def _iter_entry_points():
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        from pkg_resources import iter_entry_points
+        return iter_entry_points(ENTRY_POINT_GROUP)
+
+    eps = entry_points()
+    if hasattr(eps, 'select'):
+        return eps.select(group=ENTRY_POINT_GROUP)
+    return eps.get(ENTRY_POINT_GROUP, [])
+
+
+def _load(name):
+    module, _, attrs = name.partition(':')
+    result = __import__(module, fromlist=['__name__'])
+    for attr in attrs.split('.'):
+        result = getattr(result, attr)
+    return result
+
+
+def get_analyzer(filetype):
+    """Returns the Analyzer class for a filetype, or None if there is none.
+
+    The first time a filetype is looked up, the analyzer is imported and
+    then cached.
+    """
+    global _entry_points
+
+    analyzer = _registry.get(filetype)
+    if analyzer is None:
+        if _entry_points is None:
+            _entry_points = {}
+            for ep in _iter_entry_points():
+                _entry_points.setdefault(ep.name, ep)
+        ep = _entry_points.get(filetype)
+        if ep is None:
+            return None
+        analyzer = ep.load()
+    elif not isinstance(analyzer, type):
+        analyzer = _load(analyzer)
+
+    _registry[filetype] = analyzer
+    return analyzer
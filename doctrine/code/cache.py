@@ -0,0 +1,282 @@
+# -*- coding: UTF-8 -*-
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS blocks (
+    namespace TEXT, head TEXT, size INTEGER, digest TEXT,
+    tokens TEXT, used INTEGER,
+    PRIMARY KEY (namespace, digest, size)
+);
+CREATE INDEX IF NOT EXISTS blocks_head ON blocks (namespace, head);
+CREATE INDEX IF NOT EXISTS blocks_used ON blocks (used);
+'''
+
+# How many seconds to skip the cache after finding it busy.
+BUSY_WAIT = 1.0
+
+
+def default_cache_path():
+    """Returns the path of the cache in the users cache directory"""
+    base = os.environ.get('XDG_CACHE_HOME',
+                          os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(base, 'doctrine.code', 'analysis.sqlite')
+
+
+def _load(code, stop):
+    # Reads the rows up to stop, if there are that many, and returns the
+    # rows read.
+    try:
+        code[stop - 1]
+    except IndexError:
+        pass
+    return code.lines
+
+
+def _feed(digest, lines, row):
+    # Adds a row to the digest, or marks the end of the code and returns
+    # False. The length is included, so rows can't be joined differently.
+    if row >= len(lines):
+        digest.update(b'EOF')
+        return False
+    data = lines[row].encode('UTF8')
+    digest.update(('%d:' % len(data)).encode('ascii'))
+    digest.update(data)
+    return True
+
+
+def _digest(code, start, size):
+    lines = _load(code, start + size)
+    digest = hashlib.sha1()
+    for row in range(start, start + size):
+        if not _feed(digest, lines, row):
+            break
+    return digest.hexdigest()
+
+
+def _load_tokens(data, size):
+    # Anyone can write to the cache, so check what we get.
+    try:
+        tokens = json.loads(data)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(tokens, list) or len(tokens) != size:
+        return None
+    return tokens
+
+
+class AnalysisCache(object):
+    """A persistent cache of analyzed blocks and their tokens, so that
+    reopening a file that hasn't changed, or has only changed a bit, doesn't
+    mean it all has to be analyzed again.
+
+    Blocks are stored by a hash of their content, and of the ``lookahead``
+    rows after them that the analyzer may have looked at, so where in the
+    file they are doesn't matter. The namespace separates results from
+    different analyzers. When there are more than ``max_size`` blocks in the
+    cache, the least recently used ones are removed.
+
+    Tokens are stored as JSON, so only tokens made of lists, dictionaries,
+    strings, numbers, booleans and None can be cached, and tuples come back
+    as lists.
+
+    The cache can be shared by several processes. Added and used blocks are
+    kept in memory, and written in one transaction by ``flush``, which the
+    scheduler does every ``batch_size`` changes, and when saving. If the
+    database is busy, the cache is skipped for a while, so that the code is
+    analyzed instead.
+    """
+
+    def __init__(self, path=None, max_size=100000, batch_size=500):
+        if path is None:
+            path = default_cache_path()
+        if path != ':memory:':
+            directory = os.path.dirname(path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+        self.max_size = max_size
+        self.batch_size = batch_size
+        # Use our own transactions, and wait only briefly for others:
+        self.db = sqlite3.connect(path, timeout=0.1, isolation_level=None,
+                                  check_same_thread=False)
+        try:
+            self.db.execute('PRAGMA journal_mode = WAL')
+        except sqlite3.OperationalError:
+            pass  # Someone else is changing it; the default works too.
+        # Losing the last changes on a power failure is fine for a cache:
+        self.db.execute('PRAGMA synchronous = NORMAL')
+        self.db.executescript(SCHEMA)
+        self._used, self._count = self.db.execute(
+            'SELECT MAX(used), COUNT(*) FROM blocks').fetchone()
+        self._used = self._used or 0
+        self._busy_until = 0
+        # The changes not written yet, and a lock for them and the database,
+        # as flush is called outside the scheduler lock:
+        self._lock = threading.Lock()
+        self._added = {}  # (namespace, head) -> {(digest, size): tokens}
+        self._touched = {}  # (namespace, digest, size) -> used
+        self._changes = 0
+
+    def _available(self):
+        return time.time() >= self._busy_until
+
+    def _busy(self):
+        # Someone else is writing to the cache. Rather than waiting for
+        # every block, skip the cache for a while.
+        self._busy_until = time.time() + BUSY_WAIT
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+    def _candidates(self, namespace, head):
+        # Returns a list of (size, digest, tokens) of the blocks with this
+        # first row.
+        added = self._added.get((namespace, head), {})
+        candidates = [(size, digest, data)
+                      for (digest, size), (data, used) in added.items()]
+        if self._available():
+            try:
+                candidates.extend(self.db.execute(
+                    'SELECT size, digest, tokens FROM blocks WHERE '
+                    'namespace = ? AND head = ?', (namespace, head)))
+            except sqlite3.OperationalError:
+                self._busy()
+        return candidates
+
+    def find_block(self, namespace, code, start, lookahead=1):
+        """Returns the size of the cached block starting at the row, or None.
+
+        lookahead is the number of rows after a block that the analyzer may
+        look at, which must also be the same. The cached tokens of the block
+        are filled in, where they are None.
+        """
+        head = _digest(code, start, 1)
+        with self._lock:
+            candidates = self._candidates(namespace, head)
+        if not candidates:
+            return None
+
+        # Hash the rows once, checking each size on the way:
+        lines = _load(code, start + max(c[0] for c in candidates) +
+                      lookahead)
+        digest = hashlib.sha1()
+        row = start
+        found = None
+        for size, candidate, data in sorted(candidates, key=lambda c: c[0]):
+            while row < start + size and _feed(digest, lines, row):
+                row += 1
+            if row < start + size:
+                break  # The code ends before the block does.
+            check = digest.copy()
+            for after in range(row, row + lookahead):
+                if not _feed(check, lines, after):
+                    break
+            if check.hexdigest() == candidate and (
+                    found is None or size > found[0] or found[2] is None):
+                found = size, candidate, data
+        if found is None:
+            return None
+
+        size, candidate, data = found
+        with self._lock:
+            self._used += 1
+            self._touched[(namespace, candidate, size)] = self._used
+            self._changes += 1
+        tokens = _load_tokens(data, size)
+        if tokens is not None:
+            for offset, token in enumerate(tokens):
+                if code.tokens[start + offset] is None:
+                    code.tokens[start + offset] = token
+        return size
+
+    def add_block(self, namespace, code, start, size, lookahead=1):
+        """Store a block, and the tokens of its rows if they are all set.
+
+        The block is kept in memory until ``flush`` is called.
+        """
+        try:
+            code[start + size - 1]
+        except IndexError:
+            return
+        tokens = code.tokens[start:start + size]
+        data = None
+        if None not in tokens:
+            try:
+                data = json.dumps(tokens)
+            except (TypeError, ValueError):
+                pass  # They can't be cached.
+        head = _digest(code, start, 1)
+        digest = _digest(code, start, size + lookahead)
+        with self._lock:
+            self._used += 1
+            added = self._added.setdefault((namespace, head), {})
+            if data is None and (digest, size) in added:
+                data = added[digest, size][0]
+            added[digest, size] = data, self._used
+            self._changes += 1
+
+    def flush(self, force=True):
+        """Write the added and used blocks to the database, in one
+        transaction. Unless force is True, this is only done when there are
+        at least ``batch_size`` changes.
+        """
+        with self._lock:
+            if not self._changes or not self._available():
+                return
+            if not force and self._changes < self.batch_size:
+                return
+            try:
+                self.db.execute('BEGIN IMMEDIATE')
+                count = self._write()
+                self.db.execute('COMMIT')
+            except sqlite3.OperationalError:
+                try:
+                    self.db.execute('ROLLBACK')
+                except sqlite3.OperationalError:
+                    pass  # There was no transaction.
+                # Keep the changes, and try again later:
+                self._busy()
+                return
+            self._count = count
+            self._added = {}
+            self._touched = {}
+            self._changes = 0
+
+    def _write(self):
+        # Writes the changes, and returns the new number of blocks.
+        count = self._count
+        for (namespace, head), added in self._added.items():
+            for (digest, size), (data, used) in added.items():
+                cursor = self.db.execute(
+                    'UPDATE blocks SET used = ?, tokens = COALESCE(?, tokens) '
+                    'WHERE namespace = ? AND digest = ? AND size = ?',
+                    (used, data, namespace, digest, size))
+                if not cursor.rowcount:
+                    self.db.execute(
+                        'INSERT INTO blocks VALUES (?, ?, ?, ?, ?, ?)',
+                        (namespace, head, size, digest, data, used))
+                    count += 1
+        self.db.executemany(
+            'UPDATE blocks SET used = ? WHERE namespace = ? AND digest = ? '
+            'AND size = ?', [(used, namespace, digest, size) for
+                             (namespace, digest, size), used
+                             in self._touched.items()])
+        if count > self.max_size:
+            count = self._evict()
+        return count
+
+    def _evict(self):
+        # Other processes may have added or removed blocks, so count again.
+        count = self.db.execute('SELECT COUNT(*) FROM blocks').fetchone()[0]
+        if count <= self.max_size:
+            return count
+        # Remove a tenth extra, so we don't have to do this on every insert.
+        keep = self.max_size * 9 // 10
+        self.db.execute('DELETE FROM blocks WHERE rowid IN (SELECT rowid '
+                        'FROM blocks ORDER BY used LIMIT ?)', (count - keep,))
+        return keep
@@ -1,9 +1,17 @@
 # -*- coding: UTF-8 -*-
 import collections
 import io
+import os
+import threading
 
 from contextlib import contextmanager
 
+from doctrine.code.analysis import get_analyzer
+from doctrine.code.diff import diff_rows
+from doctrine.code.indent import IndentIndex
+from doctrine.code.layout import Layout
+from doctrine.code.scheduler import AnalysisScheduler
+
 NEWLINES = u'\n\r'
 
 
@@ -18,47 +26,168 @@ class Code(collections.MutableSequence):
 
     In addition the the MutableSequence interface (ie all the method a list has)
     ``Code`` also has the special methods ``delete_text``, ``insert_text``,
-    ``split_row`` and ``merge_rows``.
+    ``split_row``, ``merge_rows`` and ``replace_rows``.
     """
 
-    def __init__(self, file, read_ahead=50, newline='\n'):
+    def __init__(self, file, read_ahead=50, newline='\n', tab_width=8):
         self.file = file
         self.lines = []
         self.tokens = []  # Cache for widgets
+        self.layouts = []  # Cache for layout, see the layout method
+        self.tab_width = tab_width
         self.read_ahead = read_ahead
         self.newline = newline
+        self._streaming = False
+        self._indents = None
 
     def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            value = list(value)
+            self._read_slice(index)
+            start, stop, step = index.indices(len(self.lines))
+            self.lines[index] = value
+            self.tokens[index] = [None for x in value]
+            self.layouts[index] = [None for x in value]
+            if step == 1:
+                self._rows_changed(start, max(start, stop), len(value))
+            else:
+                self._indents = None
+            return
         self.lines[index] = value
         self.tokens[index] = None
+        self.layouts[index] = None
+        if index < 0:
+            index += len(self.lines)
+        self._rows_changed(index, index + 1, 1)
 
     def __delitem__(self, index):
+        if isinstance(index, slice):
+            self._read_slice(index)
+            start, stop, step = index.indices(len(self.lines))
+            stop = max(start, stop)
+        else:
+            start = index + len(self.lines) if index < 0 else index
+            stop, step = start + 1, 1
         del self.lines[index]
         del self.tokens[index]
+        del self.layouts[index]
+        if step == 1:
+            self._rows_changed(start, stop, 0)
+        else:
+            self._indents = None
+
+    def _rows_changed(self, first, last, count):
+        # The rows first up to last have been replaced with count rows.
+        # Keep the indentation index up to date, if there is one.
+        if self._indents is not None:
+            if self._indents.tab_width != self.tab_width:
+                self._indents = None
+            else:
+                self._indents.replace(first, last,
+                                      self.lines[first:first + count])
 
     def __getitem__(self, index):
-        if index < 0:
+        if isinstance(index, slice):
+            self._read_slice(index)
+        elif index < 0:
             # We must now read in the whole file:
-            while True:
-                line = self.file.readline()
-                if not line:
-                    break
-                self.lines.append(line)
-                self.tokens.append(None)
-            self._check_eof()
+            self._read(None)
+        elif index >= len(self.lines):
+            self._read(index)
 
-        while index >= len(self.lines):
+        return self.lines[index]
+
+    def _read_slice(self, index):
+        # Read the lines needed for a slice, and no more.
+        start, stop = index.start, index.stop
+        if (start is not None and start < 0) or stop is None or stop < 0:
+            self._read(None)
+        else:
+            self._read(max(start or 0, stop) - 1)
+
+    def _read(self, index):
+        """Read lines from the file until the row index exists, or to the end
+        of the file, if index is None.
+        """
+        if self._streaming:
+            raise RuntimeError("Can not read the file while streaming")
+
+        while index is None or index >= len(self.lines):
             line = self.file.readline()
             if not line:
                 self._check_eof()
                 break
             self.lines.append(line)
             self.tokens.append(None)
-
-        return self.lines[index]
+            self.layouts.append(None)
+            self._rows_changed(len(self.lines) - 1, len(self.lines) - 1, 1)
 
     def __iter__(self):
-        return iter(self.lines)
+        return self.rows()
+
+    def rows(self, start=0, stop=None):
+        """Yields the rows from start up to stop, or the end of the file.
+        Only the rows needed are read from the file, when they are needed.
+        Negative rows count from the end, like with slices, which means the
+        whole file is read.
+        """
+        if start < 0 or (stop is not None and stop < 0):
+            start, stop = slice(start, stop).indices(len(self))[:2]
+        row = start
+        while stop is None or row < stop:
+            try:
+                yield self[row]
+            except IndexError:
+                return
+            row += 1
+
+    def stream(self):
+        """Yields all the rows, like iterating does, except that rows not yet
+        read from the file are not kept in memory, so it can be used to go
+        through big files. The ``Code`` object can not be used until the
+        stream is exhausted or closed.
+        """
+        for line in self.rows(0, len(self.lines)):
+            yield line
+
+        position = self.file.tell()
+        self._streaming = True
+        try:
+            last = self.lines[-1] if self.lines else None
+            while True:
+                line = self.file.readline()
+                if not line:
+                    break
+                last = line
+                yield line
+            # The dummy line, see _check_eof:
+            if last is None or (last and last[-1] in NEWLINES):
+                yield u''
+        finally:
+            self.file.seek(position)
+            self._streaming = False
+
+    def layout(self, row):
+        """Returns the ``Layout`` of a row, with the screen columns of each
+        character and how it wraps. It's cached until the row is changed or
+        ``tab_width`` is changed.
+        """
+        line = self[row]
+        layout = self.layouts[row]
+        if layout is None or layout.tab_width != self.tab_width:
+            layout = Layout(line, self.tab_width)
+            self.layouts[row] = layout
+        return layout
+
+    def indent_index(self):
+        """Returns an ``IndentIndex`` of the indentation of the rows, for
+        folding and finding blocks. It's created the first time, which reads
+        the whole file, and is then kept up to date as the code changes.
+        """
+        if self._indents is None or self._indents.tab_width != self.tab_width:
+            self[-1]
+            self._indents = IndentIndex(self.lines, self.tab_width)
+        return self._indents
 
     def __len__(self):
         # Read in whole file:
@@ -73,10 +202,15 @@ class Code(collections.MutableSequence):
             if last and last[-1] in NEWLINES:
                 self.lines.append(u'')
                 self.tokens.append(None)
+                self.layouts.append(None)
+                self._rows_changed(len(self.lines) - 1,
+                                   len(self.lines) - 1, 1)
         except IndexError:
             # An empty file!
             self.lines.append(u'')
             self.tokens.append(None)
+            self.layouts.append(None)
+            self._rows_changed(0, 0, 1)
 
     def insert(self, index, value):
         """Insert a line before index"""
@@ -89,6 +223,11 @@ class Code(collections.MutableSequence):
         # Now we can insert:
         self.lines.insert(index, value)
         self.tokens.insert(index, None)
+        self.layouts.insert(index, None)
+        if index < 0:
+            index += len(self.lines) - 1
+        index = min(index, len(self.lines) - 1)
+        self._rows_changed(index, index, 1)
 
     def append(self, value):
         """Append a line to the end of the sequence"""
@@ -97,19 +236,26 @@ class Code(collections.MutableSequence):
             self[-1] = self[-1] + self.newline
         self.lines.append(value)
         self.tokens.append(None)
+        self.layouts.append(None)
+        self._rows_changed(len(self.lines) - 1, len(self.lines) - 1, 1)
 
     def clear(self):
         """Empty the file"""
         self.lines = []
         self.tokens = []
+        self.layouts = []
+        self._indents = None
         self.file.seek(0, 2)
 
     def extend(self, values):
         """Extend the file by appending lines"""
         if not self[-1][-1] in NEWLINES:
             self[-1] = self[-1] + self.newline
+        first = len(self.lines)
         self.lines.extend(values)
         self.tokens.extend([None for x in values])
+        self.layouts.extend([None for x in values])
+        self._rows_changed(first, first, len(self.lines) - first)
 
     def delete_text(self, fromrow, fromcol, torow, tocol):
         """Remove all text between two positions and return the deleted text.
@@ -209,26 +355,115 @@ class Code(collections.MutableSequence):
         self[last] = merged + self[last]
         del self[first:last]
 
+    def replace_rows(self, first, last, lines):
+        """Replaces the rows from first up to last with a list of lines.
+        The lines must have their line endings. Used when reloading.
+        """
+        self._read(last - 1)
+        self.lines[first:last] = lines
+        self.tokens[first:last] = [None for x in lines]
+        self.layouts[first:last] = [None for x in lines]
+        self._rows_changed(first, last, len(lines))
+
 
 class CodeContext(object):
     """A context manager that handles the opening of and saving to the file used
     by a Code instance.
+
+    When the file is opened, the ``analyzer`` attribute is set to an instance
+    of the Analyzer registered for the filetype, or None if there is none,
+    and ``scheduler`` to an ``AnalysisScheduler`` for it, using the
+    ``AnalysisCache`` passed in, if any. The scheduler is not started, and
+    its results are saved in the cache when the file is closed.
     """
 
-    def __init__(self, filename, filetype):
+    def __init__(self, filename, filetype, cache=None):
         self.filename = filename
         self.filetype = filetype
+        self.cache = cache
+        self.analyzer = None
+        self.scheduler = None
+        self._stat = None
 
     @contextmanager
     def open(self):
         """Returns a Code instance wrapping the file"""
         with io.open(self.filename, encoding='UTF8') as f:
             self.code = Code(f)
-            yield self.code
+            analyzer = get_analyzer(self.filetype)
+            if analyzer is not None:
+                self.analyzer = analyzer(self.code)
+                self.scheduler = AnalysisScheduler(self.analyzer,
+                                                   cache=self.cache)
+            self._stat = self._get_stat()
+            try:
+                yield self.code
+            finally:
+                if self.scheduler is not None:
+                    self.scheduler.stop()
+                    self.scheduler.save()
 
     def save(self):
         """Saves the content of the code object to the file"""
         # Load to end:
         self.code[-1]
         with io.open(self.filename, 'wt', encoding='UTF8') as f:
-            f.writelines(self.code)
+            # Not the code itself, as iterating over it reads the file:
+            f.writelines(self.code.lines)
+        self._stat = self._get_stat()
+
+    def _get_stat(self):
+        try:
+            stat = os.stat(self.filename)
+        except OSError:
+            return None
+        return stat.st_mtime, stat.st_size
+
+    def changed(self):
+        """Returns True if the file has changed on disk since it was opened,
+        saved or reloaded. Call this regularly to watch the file.
+        """
+        return self._get_stat() != self._stat
+
+    def reload(self):
+        """Reloads the file after it has been changed on disk.
+
+        Only the rows that differ are replaced, so unchanged rows keep their
+        tokens and the scheduler only needs to analyze the changed blocks.
+        Any changes not saved are lost. Returns the number of changed parts.
+        """
+        self._stat = self._get_stat()
+        with io.open(self.filename, encoding='UTF8') as f:
+            new = Code(io.StringIO(f.read()))
+        new[-1]
+
+        code = self.code
+        if self.scheduler is None:
+            lock = threading.RLock()
+        else:
+            lock = self.scheduler.lock
+        with lock:
+            # Rows that haven't been read yet will be replaced with the new
+            # ones, so stop reading the old file:
+            code.file = new.file
+            old = list(code.lines)
+        # Compare without blocking the analysis. Not the code itself, as that
+        # would read the old file:
+        changes = list(diff_rows(old, new.lines))
+        with lock:
+            if code.lines != old:
+                # It was changed (or read) while we compared, so do it again:
+                changes = list(diff_rows(code.lines, new.lines))
+            # Backwards, so the row numbers are still correct:
+            for first, last, first_new, last_new in reversed(changes):
+                lines = new.lines[first_new:last_new]
+                code.replace_rows(first, last, lines)
+                if self.scheduler is not None:
+                    # The scheduler needs the removed rows first, to drop
+                    # their blocks, and then the inserted rows:
+                    if last > first:
+                        self.scheduler.edited(first, first - last)
+                    if lines:
+                        self.scheduler.edited(first, len(lines))
+        return len(changes)
+
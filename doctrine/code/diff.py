@@ -0,0 +1,213 @@
+# -*- coding: UTF-8 -*-
+import collections
+
+from bisect import bisect_left
+
+# A change that replaces the rows a[first_a:last_a] with b[first_b:last_b].
+Hunk = collections.namedtuple('Hunk', 'first_a last_a first_b last_b')
+
+# How deep to look for unique lines in the gaps between unique lines.
+MAX_DEPTH = 50
+
+
+def diff_rows(a, b, max_changes=2000):
+    """Compares two ``Code`` objects (or lists of lines) and yields the
+    ``Hunk``s needed to turn a into b, in order.
+
+    Lines that occur exactly once in both are matched up first (like
+    patience diff), and then the gaps between them are compared the same
+    way, until there are no unique lines left, where Myers' algorithm is
+    used. Hunks are yielded as they are found, starting from the top.
+
+    ``max_changes`` is the largest number of rows Myers' algorithm may
+    insert plus remove in a gap, so a changed row counts twice. A gap that
+    needs more is returned as one big hunk instead.
+    """
+    # Make sure everything is loaded, and then use the lists directly:
+    len(a)
+    len(b)
+    a = getattr(a, 'lines', a)
+    b = getattr(b, 'lines', b)
+
+    x = y = 0
+    for match_x, match_y, length in _matches(a, b, 0, len(a), 0, len(b),
+                                             max_changes, 0):
+        if match_x > x or match_y > y:
+            yield Hunk(x, match_x, y, match_y)
+        x = match_x + length
+        y = match_y + length
+    if x < len(a) or y < len(b):
+        yield Hunk(x, len(a), y, len(b))
+
+
+def _trim(a, b, lo_a, hi_a, lo_b, hi_b):
+    # Returns the length of the common start and end.
+    prefix = 0
+    end = min(hi_a - lo_a, hi_b - lo_b)
+    while prefix < end and a[lo_a + prefix] == b[lo_b + prefix]:
+        prefix += 1
+    suffix = 0
+    end -= prefix
+    while suffix < end and a[hi_a - 1 - suffix] == b[hi_b - 1 - suffix]:
+        suffix += 1
+    return prefix, suffix
+
+
+def _matches(a, b, lo_a, hi_a, lo_b, hi_b, max_changes, depth):
+    """Yields (x, y, length) for runs where a[x:x + length] is equal to
+    b[y:y + length], in order.
+    """
+    prefix, suffix = _trim(a, b, lo_a, hi_a, lo_b, hi_b)
+    if prefix:
+        yield lo_a, lo_b, prefix
+    lo_a += prefix
+    lo_b += prefix
+    hi_a -= suffix
+    hi_b -= suffix
+
+    if lo_a < hi_a and lo_b < hi_b:
+        anchors = []
+        if depth < MAX_DEPTH:
+            anchors = _anchors(a, b, lo_a, hi_a, lo_b, hi_b)
+        if anchors:
+            x, y = lo_a, lo_b
+            for anchor_x, anchor_y in anchors:
+                for match in _matches(a, b, x, anchor_x, y, anchor_y,
+                                      max_changes, depth + 1):
+                    yield match
+                yield anchor_x, anchor_y, 1
+                x = anchor_x + 1
+                y = anchor_y + 1
+            for match in _matches(a, b, x, hi_a, y, hi_b, max_changes,
+                                  depth + 1):
+                yield match
+        else:
+            snake = _middle_snake(a, b, lo_a, hi_a, lo_b, hi_b, max_changes)
+            # If it's too different, it becomes one hunk.
+            if snake is not None:
+                for match in _myers(a, b, lo_a, hi_a, lo_b, hi_b, snake):
+                    yield match
+
+    if suffix:
+        yield hi_a, hi_b, suffix
+
+
+def _anchors(a, b, lo_a, hi_a, lo_b, hi_b):
+    """Returns the longest increasing list of (x, y) where a[x] == b[y] and
+    the line occurs only once in both.
+    """
+    in_a = {}
+    for x in range(lo_a, hi_a):
+        line = a[x]
+        in_a[line] = None if line in in_a else x
+    in_b = {}
+    for y in range(lo_b, hi_b):
+        line = b[y]
+        if in_a.get(line) is not None:
+            in_b[line] = None if line in in_b else y
+    pairs = sorted((in_a[line], y) for line, y in in_b.items()
+                   if y is not None)
+
+    # The longest increasing subsequence of the y:s, by patience sorting.
+    tails = []  # The smallest last y of a sequence of each length
+    ends = []  # and the index of that pair.
+    previous = []
+    for index, (x, y) in enumerate(pairs):
+        length = bisect_left(tails, y)
+        if length == len(tails):
+            tails.append(y)
+            ends.append(index)
+        else:
+            tails[length] = y
+            ends[length] = index
+        previous.append(ends[length - 1] if length else None)
+
+    anchors = []
+    index = ends[-1] if ends else None
+    while index is not None:
+        anchors.append(pairs[index])
+        index = previous[index]
+    anchors.reverse()
+    return anchors
+
+
+def _myers(a, b, lo_a, hi_a, lo_b, hi_b, snake=None):
+    """Yields the runs of a shortest edit script, using the linear space
+    version of Myers' algorithm. The middle snake can be passed in, if it
+    is already known.
+    """
+    prefix, suffix = _trim(a, b, lo_a, hi_a, lo_b, hi_b)
+    if prefix:
+        yield lo_a, lo_b, prefix
+    lo_a += prefix
+    lo_b += prefix
+    hi_a -= suffix
+    hi_b -= suffix
+
+    if lo_a < hi_a and lo_b < hi_b:
+        # With the ends trimmed, this takes at least two changes, so the
+        # middle snake splits it in two smaller parts.
+        if snake is None:
+            snake = _middle_snake(a, b, lo_a, hi_a, lo_b, hi_b)
+        x0, y0, x1, y1 = snake
+        for match in _myers(a, b, lo_a, x0, lo_b, y0):
+            yield match
+        if x1 > x0:
+            yield x0, y0, x1 - x0
+        for match in _myers(a, b, x1, hi_a, y1, hi_b):
+            yield match
+
+    if suffix:
+        yield hi_a, hi_b, suffix
+
+
+def _middle_snake(a, b, lo_a, hi_a, lo_b, hi_b, max_changes=None):
+    """Returns the (x0, y0, x1, y1) of the diagonal in the middle of a
+    shortest edit script, searching from both ends at once, or None if it
+    needs more than max_changes changes.
+    """
+    n = hi_a - lo_a
+    m = hi_b - lo_b
+    delta = n - m
+    odd = delta % 2
+    # forward[k] is how far we have got in a on diagonal k (where
+    # k = x - y), and backward[k] the same from the end.
+    forward = {1: 0}
+    backward = {1: 0}
+    for d in range((n + m + 1) // 2 + 1):
+        if max_changes is not None and 2 * d - 1 > max_changes:
+            return None
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and forward[k - 1] < forward[k + 1]):
+                x = forward[k + 1]
+            else:
+                x = forward[k - 1] + 1
+            y = x - k
+            start_x, start_y = x, y
+            while x < n and y < m and a[lo_a + x] == b[lo_b + y]:
+                x += 1
+                y += 1
+            forward[k] = x
+            if odd and -d < delta - k < d and \
+                    x + backward[delta - k] >= n:
+                return (lo_a + start_x, lo_b + start_y,
+                        lo_a + x, lo_b + y)
+
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and backward[k - 1] < backward[k + 1]):
+                x = backward[k + 1]
+            else:
+                x = backward[k - 1] + 1
+            y = x - k
+            start_x, start_y = x, y
+            while x < n and y < m and \
+                    a[hi_a - 1 - x] == b[hi_b - 1 - y]:
+                x += 1
+                y += 1
+            backward[k] = x
+            if not odd and -d <= delta - k <= d and \
+                    x + forward[delta - k] >= n:
+                if max_changes is not None and 2 * d > max_changes:
+                    return None
+                return (hi_a - x, hi_b - y,
+                        hi_a - start_x, hi_b - start_y)
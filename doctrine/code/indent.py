@@ -0,0 +1,274 @@
+# -*- coding: UTF-8 -*-
+from array import array
+
+# The indentation of blank rows. They are skipped by all the searches.
+BLANK = 2 ** 31 - 1
+
+# Rows are kept in chunks of up to twice this size.
+CHUNK_SIZE = 256
+
+
+def indent_width(line, tab_width=8):
+    """Returns the screen width of the indentation of a line, or BLANK"""
+    width = 0
+    for char in line:
+        if char == u' ':
+            width += 1
+        elif char == u'\t':
+            width += tab_width - width % tab_width
+        elif char in u'\n\r\x0c':
+            continue
+        else:
+            return width
+    return BLANK
+
+
+class IndentIndex(object):
+    """An index of the indentation of each row, used for folding and for
+    finding enclosing blocks without scanning through the code.
+
+    The indentation widths are kept in chunks, with a Fenwick tree of the
+    chunk sizes to find which chunk a row is in, and a segment tree of the
+    smallest indentation in each chunk to find the chunks to search. Both
+    searching and changing rows is then logarithmic, plus scanning at most
+    two chunks.
+
+    You normally get this from ``Code.indent_index``, which keeps it updated.
+    """
+
+    def __init__(self, lines, tab_width=8):
+        self.tab_width = tab_width
+        widths = array('l', [indent_width(line, tab_width) for line in lines])
+        self._chunks = [widths[start:start + CHUNK_SIZE]
+                        for start in range(0, len(widths), CHUNK_SIZE)]
+        if not self._chunks:
+            self._chunks = [array('l')]
+        self._rebuild()
+
+    def _rebuild(self):
+        count = len(self._chunks)
+        # Fenwick tree of the chunk sizes:
+        self._sizes = [0] * (count + 1)
+        for index, chunk in enumerate(self._chunks):
+            self._add_size(index, len(chunk))
+        # Segment tree of the smallest width in each chunk:
+        size = 1
+        while size < count:
+            size *= 2
+        self._leaves = size
+        self._tree = [BLANK] * (2 * size)
+        for index, chunk in enumerate(self._chunks):
+            self._tree[size + index] = min(chunk) if chunk else BLANK
+        for node in range(size - 1, 0, -1):
+            self._tree[node] = min(self._tree[2 * node],
+                                   self._tree[2 * node + 1])
+
+    def _add_size(self, index, delta):
+        index += 1
+        while index < len(self._sizes):
+            self._sizes[index] += delta
+            index += index & -index
+
+    def _chunk_start(self, index):
+        start = 0
+        while index > 0:
+            start += self._sizes[index]
+            index -= index & -index
+        return start
+
+    def _locate(self, row):
+        # Returns the chunk the row is in, and the row's offset in it.
+        index = 0
+        step = 1
+        while step * 2 < len(self._sizes):
+            step *= 2
+        while step:
+            if index + step < len(self._sizes) and \
+                    self._sizes[index + step] <= row:
+                index += step
+                row -= self._sizes[index]
+            step //= 2
+        if index == len(self._chunks):
+            # After the end, which is where we append.
+            index -= 1
+            row += len(self._chunks[index])
+        return index, row
+
+    def _update_min(self, index):
+        chunk = self._chunks[index]
+        node = self._leaves + index
+        self._tree[node] = min(chunk) if chunk else BLANK
+        node //= 2
+        while node:
+            self._tree[node] = min(self._tree[2 * node],
+                                   self._tree[2 * node + 1])
+            node //= 2
+
+    def __len__(self):
+        return self._chunk_start(len(self._chunks))
+
+    def _row(self, row):
+        # Rows can be negative, like list indexes, but must exist.
+        length = len(self)
+        if row < 0:
+            row += length
+        if not 0 <= row < length:
+            raise IndexError("row out of range")
+        return row
+
+    def __getitem__(self, row):
+        index, offset = self._locate(self._row(row))
+        return self._chunks[index][offset]
+
+    def indent(self, row):
+        """Returns the indentation width of a row, or None if it's blank"""
+        width = self[row]
+        if width == BLANK:
+            return None
+        return width
+
+    def replace(self, first, last, lines):
+        """Replaces the rows first up to last with these lines"""
+        if last - first == 1 and len(lines) == 1:
+            index, offset = self._locate(first)
+            self._chunks[index][offset] = indent_width(lines[0],
+                                                       self.tab_width)
+            self._update_min(index)
+            return
+
+        for row in range(last - 1, first - 1, -1):
+            index, offset = self._locate(row)
+            chunk = self._chunks[index]
+            del chunk[offset]
+            self._add_size(index, -1)
+            if not chunk and len(self._chunks) > 1:
+                del self._chunks[index]
+                self._rebuild()
+            else:
+                self._update_min(index)
+
+        for row, line in enumerate(lines, first):
+            index, offset = self._locate(row)
+            chunk = self._chunks[index]
+            chunk.insert(offset, indent_width(line, self.tab_width))
+            self._add_size(index, 1)
+            if len(chunk) > 2 * CHUNK_SIZE:
+                self._chunks[index:index + 1] = [chunk[:CHUNK_SIZE],
+                                                 chunk[CHUNK_SIZE:]]
+                self._rebuild()
+            else:
+                self._update_min(index)
+
+    def _find_last(self, node, low, high, before, limit):
+        # The last chunk before "before" that has a width smaller than limit.
+        if low >= before or self._tree[node] >= limit:
+            return None
+        if high - low == 1:
+            return low
+        middle = (low + high) // 2
+        found = self._find_last(2 * node + 1, middle, high, before, limit)
+        if found is None:
+            found = self._find_last(2 * node, low, middle, before, limit)
+        return found
+
+    def _find_first(self, node, low, high, after, limit):
+        # The first chunk after "after" that has a width smaller than limit.
+        if high <= after or self._tree[node] >= limit:
+            return None
+        if high - low == 1:
+            return low
+        middle = (low + high) // 2
+        found = self._find_first(2 * node, low, middle, after, limit)
+        if found is None:
+            found = self._find_first(2 * node + 1, middle, high, after, limit)
+        return found
+
+    def _last_before(self, row, limit):
+        # The last row before row with a width smaller than limit, or None.
+        if row <= 0:
+            return None
+        index, offset = self._locate(min(row, len(self)) - 1)
+        chunk = self._chunks[index]
+        for offset in range(offset, -1, -1):
+            if chunk[offset] < limit:
+                return self._chunk_start(index) + offset
+        index = self._find_last(1, 0, self._leaves, index, limit)
+        if index is None:
+            return None
+        chunk = self._chunks[index]
+        for offset in range(len(chunk) - 1, -1, -1):
+            if chunk[offset] < limit:
+                return self._chunk_start(index) + offset
+
+    def _first_after(self, row, limit):
+        # The first row after row with a width smaller than limit, or None.
+        if row + 1 >= len(self):
+            return None
+        index, offset = self._locate(row + 1)
+        chunk = self._chunks[index]
+        for offset in range(offset, len(chunk)):
+            if chunk[offset] < limit:
+                return self._chunk_start(index) + offset
+        index = self._find_first(1, 0, self._leaves, index + 1, limit)
+        if index is None:
+            return None
+        chunk = self._chunks[index]
+        for offset in range(len(chunk)):
+            if chunk[offset] < limit:
+                return self._chunk_start(index) + offset
+
+    def _width(self, row):
+        # Blank rows belong to the block of the next row that isn't blank.
+        width = self[row]
+        if width == BLANK:
+            following = self._first_after(row, BLANK)
+            if following is None:
+                return 0
+            width = self[following]
+        return width
+
+    def enclosing(self, row):
+        """Returns the first row of the block the row is in, that is the row
+        before it that is indented less, or None on the top level.
+        """
+        row = self._row(row)
+        return self._last_before(row, self._width(row))
+
+    def next_sibling(self, row):
+        """Returns the next row with the same indentation in the same block,
+        or None.
+        """
+        row = self._row(row)
+        width = self._width(row)
+        found = self._first_after(row, width + 1)
+        if found is not None and self[found] == width:
+            return found
+        return None
+
+    def previous_sibling(self, row):
+        """Returns the previous row with the same indentation in the same
+        block, or None.
+        """
+        row = self._row(row)
+        width = self._width(row)
+        found = self._last_before(row, width + 1)
+        if found is not None and self[found] == width:
+            return found
+        return None
+
+    def fold(self, row):
+        """Returns the (first, last) rows that fold under a row, that is the
+        rows after it that are indented more, or None if there are none.
+        Blank rows at the end are not included.
+        """
+        row = self._row(row)
+        width = self[row]
+        if width == BLANK:
+            return None
+        end = self._first_after(row, width + 1)
+        if end is None:
+            end = len(self)
+        last = self._last_before(end, BLANK)
+        if last is None or last <= row:
+            return None
+        return row + 1, last
@@ -0,0 +1,101 @@
+# -*- coding: UTF-8 -*-
+import unicodedata
+
+from array import array
+from bisect import bisect_right
+
+NEWLINES = u'\n\r'
+
+
+def char_width(char):
+    """Returns the number of screen columns a (non-tab) character uses"""
+    if unicodedata.combining(char):
+        return 0
+    if unicodedata.east_asian_width(char) in ('W', 'F'):
+        return 2
+    return 1
+
+
+def _is_simple(text):
+    # Plain ascii without tabs has one column per character.
+    if u'\t' in text:
+        return False
+    try:
+        text.encode('ascii')
+    except UnicodeError:
+        return False
+    return True
+
+
+class Layout(object):
+    """The layout of a row on the screen, with tabs expanded to the next tab
+    stop, wide east asian characters taking two columns and combining
+    characters none. The line ending is not included.
+
+    You normally get these from ``Code.layout``, which caches them.
+    """
+
+    def __init__(self, line, tab_width=8):
+        self.text = line.rstrip(NEWLINES)
+        self.tab_width = tab_width
+        self._segments = None
+        if _is_simple(self.text):
+            self.columns = None
+            self.width = len(self.text)
+            return
+
+        # The column each character starts on, and the total width last:
+        columns = array('l', [0])
+        column = 0
+        for char in self.text:
+            if char == u'\t':
+                column += tab_width - column % tab_width
+            else:
+                column += char_width(char)
+            columns.append(column)
+        self.columns = columns
+        self.width = column
+
+    def column(self, index):
+        """Returns the screen column of the character at index"""
+        if self.columns is None:
+            return min(index, self.width)
+        return self.columns[min(index, len(self.text))]
+
+    def index(self, column):
+        """Returns the index of the character shown at a screen column"""
+        if self.columns is None:
+            return min(column, self.width)
+        if column >= self.width:
+            return len(self.text)
+        return bisect_right(self.columns, column) - 1
+
+    def _fit(self, column):
+        # The index of the last character boundary at or before column.
+        if self.columns is None:
+            return min(column, self.width)
+        return bisect_right(self.columns, column) - 1
+
+    def segments(self, width):
+        """Returns the row wrapped to a screen width, as a list of (start,
+        end) character indexes. The last width used is cached.
+        """
+        if self._segments is not None and self._segments[0] == width:
+            return self._segments[1]
+
+        segments = []
+        start = 0
+        length = len(self.text)
+        while True:
+            end = self._fit(self.column(start) + width)
+            if end <= start:
+                # Always show at least one character:
+                end = start + 1
+            if end >= length:
+                segments.append((start, length))
+                break
+            segments.append((start, end))
+            start = end
+
+        self._segments = (width, segments)
+        return segments
@@ -0,0 +1,270 @@
+# -*- coding: UTF-8 -*-
+import threading
+import time
+
+from bisect import bisect_left, bisect_right
+
+# Priorities of pending blocks, lowest first.
+EDITED = 0
+VISIBLE = 1
+BACKGROUND = 2
+
+
+class AnalysisScheduler(object):
+    """Schedules ``Analyzer.find_block`` calls so that a whole ``Code`` object
+    eventually gets analyzed, in the background.
+
+    The code is split into blocks, where each block is what ``find_block``
+    returns for its first row. The first block starts on row 0, and every
+    block starts where the previous one ended. Analyzed blocks are available
+    in ``blocks``, a dictionary of start row to number of rows.
+
+    Since a block can only be found when the block before it is known, the
+    first analysis goes from the top of the file to the end, and the rows
+    on screen are not reached before the rows above them. Once that is done,
+    blocks changed with ``edited`` are analyzed first, then the ones on the
+    screen (see ``set_viewport``), and then the rest, closest first.
+
+    A ``Code`` object is not thread safe, so only one block is analyzed at a
+    time, while holding ``lock``. Code that modifies the ``Code`` object while
+    a worker thread is running must hold the lock too, and then tell the
+    scheduler about the change with ``edited``. Since a block is at most
+    ``max_block`` rows, this will never wait for long.
+
+    You can either call ``step`` from the idle loop of your application, or
+    use ``start`` and ``stop`` to run the analysis in a worker thread. If
+    the analyzer raises an exception, ``step`` passes it on, and the block
+    is still pending. The worker thread instead stores the exception in
+    ``error``, and treats the block as a single row, so it can continue.
+
+    If an ``AnalysisCache`` is passed in, blocks are looked up in it before
+    they are analyzed, and the tokens of cached blocks are filled in. Call
+    ``save`` to store the tokens of the analyzed blocks in the cache. The
+    cache is written to without holding the lock.
+    """
+
+    def __init__(self, analyzer, max_block=100, cache=None):
+        self.analyzer = analyzer
+        self.code = analyzer.code
+        self.max_block = max_block
+        self.cache = cache
+        # The rows after a block the analyzer may look at, for the cache:
+        self.lookahead = getattr(analyzer, 'lookahead', 1)
+        self.blocks = {}
+        self.lock = threading.RLock()
+        self.viewport = (0, 0)
+        self._starts = []  # Sorted start rows of the analyzed blocks
+        self._pending = {0: BACKGROUND}
+        self._wakeup = threading.Condition(self.lock)
+        self._thread = None
+        self._running = False
+        self._current = None  # The block being analyzed
+        self.error = None
+
+    @property
+    def namespace(self):
+        """The namespace of the results in the cache. A block depends on
+        max_block as well as the analyzer, as it may be cut short by it.
+        """
+        cls = type(self.analyzer)
+        return '%s.%s:%s' % (cls.__module__, cls.__name__, self.max_block)
+
+    @property
+    def done(self):
+        """True when the whole code has been analyzed"""
+        with self.lock:
+            return not self._pending
+
+    def set_viewport(self, first, last):
+        """Set which rows are visible, so they get analyzed first"""
+        with self.lock:
+            self.viewport = (first, last)
+
+    def block_at(self, row):
+        """Returns the (start, size) of the analyzed block containing the row,
+        or None if that part of the code has not been analyzed yet.
+        """
+        with self.lock:
+            index = bisect_right(self._starts, row) - 1
+            if index < 0:
+                return None
+            start = self._starts[index]
+            size = self.blocks[start]
+            if row >= start + size:
+                return None
+            return start, size
+
+    def edited(self, row, delta=0):
+        """Tell the scheduler that the code was changed from row and onwards.
+
+        delta is the number of rows that were inserted (or removed, if it is
+        negative) at that row. The block the change is in gets re-analyzed
+        before anything else, and pending work for changed rows is dropped.
+        Blocks after the change are moved, but kept.
+        """
+        with self.lock:
+            # The first changed row can be in the middle of a block:
+            index = bisect_right(self._starts, row) - 1
+            if index < 0:
+                start = 0
+                index = 0
+            else:
+                start = self._starts[index]
+            last = row - delta if delta < 0 else row
+            end = bisect_right(self._starts, last)
+
+            for old in self._starts[index:end]:
+                del self.blocks[old]
+            moved = [(old + delta, self.blocks.pop(old))
+                     for old in self._starts[end:]]
+            self.blocks.update(moved)
+            self._starts[index:] = [old for old, size in moved]
+
+            pending = {}
+            for old, priority in self._pending.items():
+                if old < start:
+                    pending[old] = priority
+                elif old > last:
+                    pending[old + delta] = priority
+                # Else it's a stale job, and is dropped.
+            pending[start] = EDITED
+            self._pending = pending
+            self._wakeup.notify()
+
+    def _priority(self, row):
+        first, last = self.viewport
+        priority = self._pending[row]
+        if priority == BACKGROUND and first <= row <= last:
+            priority = VISIBLE
+        if row < first:
+            distance = first - row
+        else:
+            distance = max(0, row - last)
+        return priority, distance
+
+    def step(self):
+        """Analyze the most urgent pending block.
+
+        Returns False if there was nothing left to analyze.
+        """
+        with self.lock:
+            more = self._step()
+        self._flush(force=False)
+        return more
+
+    def _step(self):
+        with self.lock:
+            if not self._pending:
+                return False
+            start = min(self._pending, key=self._priority)
+            self._current = start
+
+            try:
+                self.code[start]
+            except IndexError:
+                # The start is after the end of the code.
+                del self._pending[start]
+                self._current = None
+                return True
+
+            size = None
+            if self.cache is not None:
+                size = self.cache.find_block(self.namespace, self.code, start,
+                                             self.lookahead)
+            if size is None:
+                lines = self.analyzer.find_block(start, self.max_block)
+                # A block is always at least one row, or we would never
+                # finish.
+                size = max(len(lines), 1)
+                if self.cache is not None:
+                    self.cache.add_block(self.namespace, self.code, start,
+                                         size, self.lookahead)
+            self._add(start, size)
+            self._current = None
+            return True
+
+    def _add(self, start, size):
+        # Store an analyzed block, and schedule the block after it.
+        with self.lock:
+            del self._pending[start]
+            end = start + size
+
+            # Remove the blocks this block now overlaps:
+            index = bisect_left(self._starts, start)
+            stop = bisect_left(self._starts, end)
+            for old in self._starts[index:stop]:
+                del self.blocks[old]
+            self._starts[index:stop] = [start]
+            self.blocks[start] = size
+            for old in list(self._pending):
+                if start < old < end:
+                    del self._pending[old]
+
+            if end in self.blocks or end in self._pending:
+                # The rest has been (or will be) analyzed already.
+                return
+            try:
+                self.code[end]
+            except IndexError:
+                # This was the last block.
+                return
+            self._pending[end] = BACKGROUND
+
+    def save(self):
+        """Store the analyzed blocks and their tokens in the cache"""
+        if self.cache is None:
+            return
+        with self.lock:
+            for start, size in self.blocks.items():
+                if None in self.code.tokens[start:start + size]:
+                    # Nothing new to store, it was added when analyzed.
+                    continue
+                self.cache.add_block(self.namespace, self.code, start, size,
+                                     self.lookahead)
+        self._flush()
+
+    def _flush(self, force=True):
+        # Called without the lock, so the editor isn't blocked meanwhile.
+        if self.cache is not None:
+            self.cache.flush(force)
+
+    def start(self):
+        """Start analyzing in a background thread"""
+        with self.lock:
+            if self._thread is not None:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._work)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """Stop the background thread, waiting for the current block"""
+        with self.lock:
+            thread = self._thread
+            if thread is None:
+                return
+            self._running = False
+            self._thread = None
+            self._wakeup.notify()
+        thread.join()
+
+    def _work(self):
+        while True:
+            with self.lock:
+                while self._running and not self._pending:
+                    self._wakeup.wait()
+                if not self._running:
+                    return
+                try:
+                    self._step()
+                except Exception as e:
+                    # Don't let a broken analyzer stop the analysis.
+                    self.error = e
+                    start = self._current
+                    self._current = None
+                    if start is not None and start in self._pending:
+                        self._add(start, 1)
+            self._flush(force=False)
+            # Let any waiting editor get hold of the lock.
+            time.sleep(0)
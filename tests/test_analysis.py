@@ -3,6 +3,7 @@ import io
 import unittest
 from doctrine.code import Code
 from doctrine.code import Analyzer
+from doctrine.code import analysis
 
 TEST_CODE = u'''class CodeLayout(TextLayout):
     """This is a docstring"""
@@ -63,7 +64,11 @@ class PythonTestAnalyzer(Analyzer):
         for row in range(start_row, start_row + max_block):
 
             pos = 0
-            line = self.code[row]
+            try:
+                line = self.code[row]
+            except IndexError:
+                # An unfinished string ends with the file.
+                return lines
             lines.append(line)
             l = len(line)
 
@@ -140,3 +145,41 @@ class TestAnalysis(unittest.TestCase):
                           '        Calculate the segments of text to display '
                           'given width screen\n',
                           '        columns to display them.\n'])
+
+
+class FakeEntryPoint(object):
+    name = 'fake'
+
+    def load(self):
+        return PythonTestAnalyzer
+
+
+class TestRegistry(unittest.TestCase):
+
+    def tearDown(self):
+        analysis._registry.clear()
+        analysis._entry_points = None
+
+    def test_register(self):
+        self.assertEqual(analysis.get_analyzer('python'), None)
+        analysis.register_analyzer('python', PythonTestAnalyzer)
+        self.assertIs(analysis.get_analyzer('python'), PythonTestAnalyzer)
+
+    def test_register_lazy(self):
+        analysis.register_analyzer(
+            'python', 'tests.test_analysis:PythonTestAnalyzer')
+        self.assertIs(analysis.get_analyzer('python'), PythonTestAnalyzer)
+        # The class is now cached:
+        self.assertIs(analysis._registry['python'], PythonTestAnalyzer)
+
+    def test_register_invalid(self):
+        self.assertRaises(ValueError, analysis.register_analyzer,
+                          'python', 'tests.test_analysis')
+        self.assertRaises(ValueError, analysis.register_analyzer,
+                          'python', ':PythonTestAnalyzer')
+        self.assertEqual(analysis.get_analyzer('python'), None)
+
+    def test_entry_point(self):
+        analysis._entry_points = {'fake': FakeEntryPoint()}
+        self.assertIs(analysis.get_analyzer('fake'), PythonTestAnalyzer)
+        self.assertIs(analysis._registry['fake'], PythonTestAnalyzer)
@@ -0,0 +1,181 @@
+# -*- coding: UTF-8 -*-
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from doctrine.code import Code
+from doctrine.code import AnalysisCache, AnalysisScheduler
+
+from tests.test_analysis import PythonTestAnalyzer, TEST_CODE
+
+
+class CountingAnalyzer(PythonTestAnalyzer):
+
+    calls = 0
+
+    def find_block(self, start_row, max_block):
+        self.calls += 1
+        return PythonTestAnalyzer.find_block(self, start_row, max_block)
+
+
+class IndentAnalyzer(CountingAnalyzer):
+
+    def find_block(self, start_row, max_block):
+        # A row and the rows after it that are indented more. Where that
+        # ends depends on the row after the block.
+        self.calls += 1
+        first = self.code[start_row]
+        indent = len(first) - len(first.lstrip())
+        row = start_row + 1
+        while row < start_row + max_block:
+            try:
+                line = self.code[row]
+            except IndexError:
+                break
+            if not line.strip() or len(line) - len(line.lstrip()) <= indent:
+                break
+            row += 1
+        return self.code[start_row:row]
+
+
+class TestAnalysisCache(unittest.TestCase):
+
+    def analyze(self, cache, text, analyzer=CountingAnalyzer):
+        c = Code(io.StringIO(text))
+        s = AnalysisScheduler(analyzer(c), cache=cache)
+        while s.step():
+            pass
+        return s
+
+    def test_reopen(self):
+        cache = AnalysisCache(':memory:')
+        first = self.analyze(cache, TEST_CODE)
+        self.assertTrue(first.analyzer.calls > 0)
+
+        second = self.analyze(cache, TEST_CODE)
+        self.assertEqual(second.analyzer.calls, 0)
+        self.assertEqual(second.blocks, first.blocks)
+
+        # Changing the docstring means that block has to be analyzed again,
+        # but only that one:
+        changed = TEST_CODE.replace('screen\n', 'screen\n\n')
+        third = self.analyze(cache, changed)
+        self.assertEqual(third.analyzer.calls, 1)
+        self.assertEqual(third.block_at(8), (6, 11))
+
+    def test_tokens(self):
+        cache = AnalysisCache(':memory:')
+        first = self.analyze(cache, TEST_CODE)
+        code = first.code
+        code.tokens = [len(line) for line in code.lines]
+        first.save()
+
+        second = self.analyze(cache, TEST_CODE)
+        self.assertEqual(second.code.tokens, code.tokens)
+
+    def test_eviction(self):
+        cache = AnalysisCache(':memory:', max_size=10)
+        s = self.analyze(cache, TEST_CODE)
+        cache.flush()
+        count = cache.db.execute('SELECT COUNT(*) FROM blocks').fetchone()[0]
+        self.assertTrue(count <= 10)
+        # The first blocks are no longer cached:
+        self.assertEqual(cache.find_block(s.namespace, s.code, 0), None)
+        # But the last one is:
+        self.assertEqual(cache.find_block(s.namespace, s.code, 43), 1)
+
+    def test_max_block(self):
+        cache = AnalysisCache(':memory:')
+        self.analyze(cache, TEST_CODE)
+        c = Code(io.StringIO(TEST_CODE))
+        s = AnalysisScheduler(CountingAnalyzer(c), max_block=3, cache=cache)
+        while s.step():
+            pass
+        # The docstring is cut short, and not taken from the cache:
+        self.assertEqual(s.block_at(6), (6, 3))
+        self.assertTrue(max(s.blocks.values()) <= 3)
+
+    def test_shared(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'cache.sqlite')
+
+        first = AnalysisCache(path)
+        second = AnalysisCache(path)
+        self.analyze(first, TEST_CODE)
+        first.flush()
+        # The other process sees the blocks once they are written:
+        s = self.analyze(second, TEST_CODE)
+        self.assertEqual(s.analyzer.calls, 0)
+
+        # If the cache is locked, the changes are kept until later:
+        first.db.execute('BEGIN EXCLUSIVE')
+        s = self.analyze(second, TEST_CODE.replace('8', '4'))
+        # The row and the one before it, which sees it as lookahead:
+        self.assertEqual(s.analyzer.calls, 2)
+        second.flush()
+        self.assertTrue(second._busy_until > 0)
+        self.assertTrue(second._changes > 0)
+        # And the cache is skipped meanwhile:
+        s = self.analyze(second, TEST_CODE.replace('8', '2'))
+        self.assertTrue(s.done)
+        self.assertEqual(sum(s.blocks.values()), len(s.code))
+        first.db.execute('ROLLBACK')
+
+        second._busy_until = 0
+        second.flush()
+        self.assertEqual(second._changes, 0)
+        s = self.analyze(first, TEST_CODE.replace('8', '4'))
+        self.assertEqual(s.analyzer.calls, 0)
+        first.close()
+        second.close()
+
+    def test_batch(self):
+        cache = AnalysisCache(':memory:', batch_size=1000)
+        self.analyze(cache, TEST_CODE)
+        # Nothing is written until there are enough changes:
+        self.assertEqual(cache.db.total_changes, 0)
+        # But the blocks are found anyway:
+        s = self.analyze(cache, TEST_CODE)
+        self.assertEqual(s.analyzer.calls, 0)
+
+        cache.flush()
+        changes = cache.db.total_changes
+        self.assertTrue(changes > 0)
+        s = self.analyze(cache, TEST_CODE)
+        self.assertEqual(s.analyzer.calls, 0)
+        self.assertEqual(cache.db.total_changes, changes)
+
+        cache.batch_size = 10
+        self.analyze(cache, TEST_CODE)
+        self.assertTrue(cache.db.total_changes > changes)
+
+    def test_lookahead(self):
+        cache = AnalysisCache(':memory:')
+        first = self.analyze(cache, u'def f():\n  a\nx\n', IndentAnalyzer)
+        self.assertEqual(sorted(first.blocks.items()),
+                         [(0, 2), (2, 1), (3, 1)])
+
+        # The block at the start is the same, but ends differently:
+        second = self.analyze(cache, u'def f():\n  a\n  b\nx\n',
+                              IndentAnalyzer)
+        self.assertEqual(sorted(second.blocks.items()),
+                         [(0, 3), (3, 1), (4, 1)])
+
+    def test_json_tokens(self):
+        cache = AnalysisCache(':memory:')
+        s = self.analyze(cache, u'a\nb\n')
+        s.code.tokens = [[u'a', 1], (u'b', 2), None]
+        s.save()
+        s.code.tokens = [None, object(), None]
+        s.save()
+
+        s = self.analyze(cache, u'a\nb\n')
+        # Tuples become lists, and other objects can't be cached:
+        self.assertEqual(s.code.tokens, [[u'a', 1], [u'b', 2], None])
+
+        # Tokens that don't fit the block are ignored:
+        cache.db.execute('UPDATE blocks SET tokens = ?', ('[1, 2]',))
+        s = self.analyze(cache, u'a\nb\n')
+        self.assertEqual(s.code.tokens, [None, None, None])
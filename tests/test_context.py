@@ -1,8 +1,13 @@
 # -*- coding: UTF-8 -*-
+import io
+import os
 import tempfile
 import unittest
 
 from doctrine import code
+from doctrine.code import analysis
+
+from tests.test_analysis import PythonTestAnalyzer
 
 
 class TestCodeContext(unittest.TestCase):
@@ -21,3 +26,80 @@ class TestCodeContext(unittest.TestCase):
             tmp.seek(0)
             text = tmp.read()
             self.assertEqual(text, 'a text\n')
+
+    def test_reload(self):
+        with tempfile.NamedTemporaryFile() as tmp:
+            with io.open(tmp.name, 'wt', encoding='UTF8') as f:
+                f.write(u'This is\na text\nwith\nseveral lines\n')
+
+            context = code.CodeContext(tmp.name, 'txt')
+            with context.open() as c:
+                self.assertFalse(context.changed())
+                c[-1]  # Load everything
+                c.tokens = ['a', 'b', 'c', 'd', 'e']
+
+                with io.open(tmp.name, 'wt', encoding='UTF8') as f:
+                    f.write(u'This is\nthe text\nwith\nseveral lines\nmore\n')
+                os.utime(tmp.name, (0, 0))
+                self.assertTrue(context.changed())
+
+                self.assertEqual(context.reload(), 2)
+                self.assertFalse(context.changed())
+                self.assertEqual(list(c), [u'This is\n', u'the text\n',
+                                           u'with\n', u'several lines\n',
+                                           u'more\n', u''])
+                self.assertEqual(c.tokens, ['a', None, 'c', 'd', None, 'e'])
+
+    def test_reload_scheduler(self):
+        analysis.register_analyzer('test-reload', PythonTestAnalyzer)
+        self.addCleanup(analysis._registry.pop, 'test-reload')
+        with tempfile.NamedTemporaryFile() as tmp:
+            with io.open(tmp.name, 'wt', encoding='UTF8') as f:
+                f.write(u'x\ny\nw\nv\n')
+
+            context = code.CodeContext(tmp.name, 'test-reload')
+            with context.open() as c:
+                scheduler = context.scheduler
+                while scheduler.step():
+                    pass
+
+                # The replaced rows start a multiline string:
+                with io.open(tmp.name, 'wt', encoding='UTF8') as f:
+                    f.write(u'A\nB\n"""\nw\n"""\nv\n')
+                context.reload()
+                while scheduler.step():
+                    pass
+                self.assertEqual(sorted(scheduler.blocks.items()),
+                                 [(0, 1), (1, 1), (2, 3), (5, 1), (6, 1)])
+
+    def test_reload_lazy(self):
+        with tempfile.NamedTemporaryFile() as tmp:
+            with io.open(tmp.name, 'wt', encoding='UTF8') as f:
+                f.write(u'This is\na text\nwith\nseveral lines')
+
+            context = code.CodeContext(tmp.name, 'txt')
+            with context.open() as c:
+                self.assertEqual(c[0], u'This is\n')
+                c.tokens = ['a']
+
+                with io.open(tmp.name, 'wt', encoding='UTF8') as f:
+                    f.write(u'This is\nthe text')
+                context.reload()
+                self.assertEqual(len(c), 2)
+                self.assertEqual(c[1], u'the text')
+                self.assertEqual(c.tokens, ['a', None])
+
+    def test_save_bigger(self):
+        with tempfile.NamedTemporaryFile() as tmp:
+            with io.open(tmp.name, 'wt', encoding='UTF8') as f:
+                f.write(u'A line')
+
+            context = code.CodeContext(tmp.name, 'txt')
+            with context.open() as c:
+                c.extend([u'Row %s\n' % x for x in range(5000)])
+                context.save()
+
+            with io.open(tmp.name, encoding='UTF8') as f:
+                lines = f.readlines()
+            self.assertEqual(len(lines), 5001)
+            self.assertEqual(lines[-1], u'Row 4999\n')
@@ -0,0 +1,86 @@
+# -*- coding: UTF-8 -*-
+import io
+import random
+import unittest
+from doctrine.code import Code
+from doctrine.code import Hunk, diff_rows
+
+from tests.test_analysis import TEST_CODE
+
+
+def apply(a, hunks):
+    # Apply backwards, so the row numbers are still correct.
+    result = list(a)
+    for hunk, lines in reversed(hunks):
+        result[hunk.first_a:hunk.last_a] = lines
+    return result
+
+
+def lcs(a, b):
+    # The length of the longest common subsequence, the slow way.
+    lengths = [[0] * (len(b) + 1) for x in range(len(a) + 1)]
+    for x in range(len(a) - 1, -1, -1):
+        for y in range(len(b) - 1, -1, -1):
+            if a[x] == b[y]:
+                lengths[x][y] = lengths[x + 1][y + 1] + 1
+            else:
+                lengths[x][y] = max(lengths[x + 1][y], lengths[x][y + 1])
+    return lengths[0][0]
+
+
+class TestDiff(unittest.TestCase):
+
+    def test_code(self):
+        a = Code(io.StringIO(TEST_CODE))
+        b = Code(io.StringIO(TEST_CODE.replace('    tab_width = 8\n', '')))
+        self.assertEqual(list(diff_rows(a, b)), [Hunk(3, 4, 3, 3)])
+        self.assertEqual(list(diff_rows(a, a)), [])
+
+    def test_hunks(self):
+        a = ['a\n', 'b\n', 'c\n', 'd\n', 'e\n', 'f\n']
+        b = ['a\n', 'x\n', 'c\n', 'd\n', 'f\n', 'g\n']
+        self.assertEqual(list(diff_rows(a, b)),
+                         [Hunk(1, 2, 1, 2), Hunk(4, 5, 4, 4),
+                          Hunk(6, 6, 5, 6)])
+        self.assertEqual(list(diff_rows([], b)), [Hunk(0, 0, 0, 6)])
+        self.assertEqual(list(diff_rows(a, [])), [Hunk(0, 6, 0, 0)])
+
+    def test_random(self):
+        rnd = random.Random(42)
+        for x in range(50):
+            a = [rnd.choice('abcde') for x in range(rnd.randint(0, 30))]
+            b = [rnd.choice('abcde') for x in range(rnd.randint(0, 30))]
+            hunks = [(hunk, b[hunk.first_b:hunk.last_b])
+                     for hunk in diff_rows(a, b)]
+            self.assertEqual(apply(a, hunks), b)
+
+    def test_myers(self):
+        # Without unique lines, the diff is minimal:
+        rnd = random.Random(42)
+        for x in range(50):
+            a = [rnd.choice('ab') for x in range(rnd.randint(0, 30))]
+            b = [rnd.choice('ab') for x in range(rnd.randint(0, 30))]
+            changes = sum(hunk.last_a - hunk.first_a +
+                          hunk.last_b - hunk.first_b
+                          for hunk in diff_rows(a, b))
+            self.assertEqual(changes, len(a) + len(b) - 2 * lcs(a, b))
+
+    def test_unique_lines(self):
+        # Unique lines are matched first, so the gaps are small:
+        a = ['%s\n' % x for x in range(10000)]
+        b = list(a)
+        b[10] = 'x\n'
+        del b[5000]
+        b.insert(9000, 'y\n')
+        self.assertEqual(list(diff_rows(a, b, max_changes=2)),
+                         [Hunk(10, 11, 10, 11), Hunk(5000, 5001, 5000, 5000),
+                          Hunk(9001, 9001, 9000, 9001)])
+
+    def test_max_changes(self):
+        # Removing a row and inserting another is two changes:
+        a = ['x\n', 'y\n', 'x\n', 'y\n']
+        b = ['y\n', 'x\n', 'y\n', 'x\n']
+        self.assertEqual(list(diff_rows(a, b, max_changes=2)),
+                         [Hunk(0, 1, 0, 0), Hunk(4, 4, 3, 4)])
+        self.assertEqual(list(diff_rows(a, b, max_changes=1)),
+                         [Hunk(0, 4, 0, 4)])
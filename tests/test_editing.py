@@ -30,6 +30,73 @@ class TestCodeEditing(unittest.TestCase):
             i += 1
         self.assertEqual(i, 3)
 
+    def test_iteration(self):
+        f = io.StringIO(u'A text\nwith several\nlines\n')
+        c = Code(f, 'text')
+        rows = iter(c)
+        self.assertEqual(next(rows), 'A text\n')
+        # Iterating only reads the lines as they are needed:
+        self.assertEqual(len(c.lines), 1)
+        self.assertEqual(list(rows), ['with several\n', 'lines\n', ''])
+
+        # Get a part of the file:
+        f = io.StringIO(u'A text\nwith several\nlines\n')
+        c = Code(f, 'text')
+        self.assertEqual(list(c.rows(1, 2)), ['with several\n'])
+        self.assertEqual(len(c.lines), 2)
+        self.assertEqual(list(c.rows(2, 10)), ['lines\n', ''])
+
+        # Negative rows count from the end:
+        self.assertEqual(list(c.rows(-2)), ['lines\n', ''])
+        self.assertEqual(list(c.rows(0, -2)), ['A text\n', 'with several\n'])
+        self.assertEqual(list(c.rows(-10, 1)), ['A text\n'])
+        self.assertEqual(list(c.rows(-1, -2)), [])
+
+    def test_slicing(self):
+        f = io.StringIO(u'A text\nwith several\nlines')
+        c = Code(f, 'text')
+        self.assertEqual(c[0:2], ['A text\n', 'with several\n'])
+        self.assertEqual(len(c.lines), 2)
+        self.assertEqual(c[1:], ['with several\n', 'lines'])
+
+        c[0:2] = ['One line\n']
+        self.assertEqual(c.lines, ['One line\n', 'lines'])
+        self.assertEqual(c.tokens, [None, None])
+
+    def test_slice_editing(self):
+        # Editing slices reads the rows first:
+        f = io.StringIO(u'A\nB\nC\nD\nE\n')
+        c = Code(f, 'text')
+        self.assertEqual(c[0], 'A\n')
+        c[3:4] = ['X\n']
+        self.assertEqual(c[1], 'B\n')
+        self.assertEqual(c[3], 'X\n')
+        self.assertEqual(len(c.tokens), len(c.lines))
+
+        f = io.StringIO(u'A\nB\nC\nD\nE\n')
+        c = Code(f, 'text')
+        self.assertEqual(c[0], 'A\n')
+        del c[2:4]
+        self.assertEqual(list(c), ['A\n', 'B\n', 'E\n', ''])
+
+    def test_stream(self):
+        f = io.StringIO(u'A text\nwith several\nlines\n')
+        c = Code(f, 'text')
+        self.assertEqual(c[0], 'A text\n')
+        c.tokens[0] = 'token'
+        stream = c.stream()
+        self.assertEqual(next(stream), 'A text\n')
+        self.assertEqual(next(stream), 'with several\n')
+        # You can't use the code while streaming:
+        self.assertRaises(RuntimeError, c.__getitem__, 2)
+        self.assertEqual(list(stream), ['lines\n', ''])
+
+        # The rows read while streaming were not kept:
+        self.assertEqual(c.lines, ['A text\n'])
+        self.assertEqual(c.tokens, ['token'])
+        self.assertEqual(list(c), ['A text\n', 'with several\n', 'lines\n',
+                                   ''])
+
     def test_delete_code(self):
         f = io.StringIO(u'A text\nwith several\nlines')
         c = Code(f, 'text')
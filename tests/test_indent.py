@@ -0,0 +1,127 @@
+# -*- coding: UTF-8 -*-
+import io
+import random
+import unittest
+from doctrine.code import Code
+from doctrine.code import IndentIndex
+from doctrine.code import indent
+
+from tests.test_analysis import TEST_CODE
+
+
+class TestIndentIndex(unittest.TestCase):
+
+    def test_queries(self):
+        c = Code(io.StringIO(TEST_CODE))
+        index = c.indent_index()
+        self.assertEqual(len(index), len(c))
+        self.assertEqual(index.indent(5), 4)
+        self.assertEqual(index.indent(2), None)
+
+        # The method is in the class:
+        self.assertEqual(index.enclosing(5), 0)
+        self.assertEqual(index.enclosing(0), None)
+        # The docstring, and the blank line in it, is in the method:
+        self.assertEqual(index.enclosing(6), 5)
+        self.assertEqual(index.enclosing(9), 5)
+
+        self.assertEqual(index.next_sibling(1), 3)
+        self.assertEqual(index.next_sibling(3), 5)
+        self.assertEqual(index.next_sibling(5), None)
+        self.assertEqual(index.previous_sibling(5), 3)
+        self.assertEqual(index.previous_sibling(1), None)
+
+        self.assertEqual(index.fold(0), (1, 23))
+        self.assertEqual(index.fold(5), (6, 23))
+        self.assertEqual(index.fold(1), None)
+        self.assertEqual(index.fold(26), (27, 30))
+        # The blank row in the block is included, but not the last one:
+        self.assertEqual(index.fold(33), (34, 45))
+        self.assertEqual(index.enclosing(40), 37)
+        # The blank row is in the block that follows:
+        self.assertEqual(index.enclosing(41), 33)
+
+    def test_negative_rows(self):
+        lines = [u' ' * (row % 5) + u'x\n' for row in range(600)]
+        index = IndentIndex(lines)
+        self.assertEqual(index.indent(-1), 4)
+        self.assertEqual(index.indent(-600), 0)
+        self.assertEqual(index.enclosing(-1), index.enclosing(599))
+        self.assertEqual(index.fold(-5), index.fold(595))
+        self.assertEqual(index.previous_sibling(-5), 590)
+        self.assertEqual(index.next_sibling(-10), 595)
+        self.assertRaises(IndexError, index.indent, -601)
+        self.assertRaises(IndexError, index.indent, 600)
+        self.assertRaises(IndexError, index.fold, 600)
+
+    def test_tabs(self):
+        index = IndentIndex([u'if x:\n', u'\tpass\n', u'        pass\n',
+                             u'  \t  pass\n'])
+        self.assertEqual([index.indent(row) for row in range(4)],
+                         [0, 8, 8, 10])
+
+    def test_edits(self):
+        c = Code(io.StringIO(TEST_CODE))
+        index = c.indent_index()
+        c.insert(5, u'    @property\n')
+        self.assertEqual(index.enclosing(6), 0)
+        self.assertEqual(index.next_sibling(5), 6)
+        c.split_row(6, 4, '\n')
+        self.assertEqual(index.indent(7), 0)
+        self.assertEqual(index.enclosing(8), 7)
+        c.merge_rows(6, 7)
+        del c[5]
+        self.assertIs(c.indent_index(), index)
+        self.assertEqual(list(index), list(IndentIndex(c.lines)))
+
+        # Changing the tab width makes a new index:
+        c.tab_width = 4
+        self.assertIsNot(c.indent_index(), index)
+
+    def test_random(self):
+        # Make sure the chunks get split and removed:
+        self.addCleanup(setattr, indent, 'CHUNK_SIZE', indent.CHUNK_SIZE)
+        indent.CHUNK_SIZE = 4
+
+        rnd = random.Random(42)
+        lines = [u' ' * rnd.randint(0, 4) + u'x\n' for x in range(50)]
+        index = IndentIndex(lines)
+        for x in range(200):
+            first = rnd.randint(0, len(lines))
+            last = min(len(lines), first + rnd.randint(0, 3))
+            new = [rnd.choice([u'\n', u'  x\n', u'x\n', u' x\n'])
+                   for x in range(rnd.randint(0, 3))]
+            lines[first:last] = new
+            index.replace(first, last, new)
+
+        widths = [indent.indent_width(line) for line in lines]
+        self.assertEqual(list(index), widths)
+        for row in range(len(lines)):
+            self.assertEqual(index.enclosing(row), enclosing(widths, row))
+            self.assertEqual(index.fold(row), fold(widths, row))
+
+
+# Slow, but obviously correct, versions of the queries:
+
+def enclosing(widths, row):
+    following = [w for w in widths[row:] if w != indent.BLANK]
+    width = following[0] if following else 0
+    for found in range(row - 1, -1, -1):
+        if widths[found] < width:
+            return found
+    return None
+
+
+def fold(widths, row):
+    width = widths[row]
+    if width == indent.BLANK:
+        return None
+    last = None
+    for found in range(row + 1, len(widths)):
+        if widths[found] <= width:
+            break
+        if widths[found] != indent.BLANK:
+            last = found
+    if last is None:
+        return None
+    return row + 1, last
@@ -0,0 +1,68 @@
+# -*- coding: UTF-8 -*-
+import io
+import unittest
+from doctrine.code import Code
+from doctrine.code import Layout
+
+
+class TestLayout(unittest.TestCase):
+
+    def test_simple(self):
+        layout = Layout(u'A simple line\n')
+        self.assertEqual(layout.width, 13)
+        self.assertEqual(layout.column(2), 2)
+        self.assertEqual(layout.index(2), 2)
+        self.assertEqual(layout.index(20), 13)
+
+    def test_tabs(self):
+        layout = Layout(u'\tif x:\tpass\n', tab_width=4)
+        self.assertEqual(layout.width, 16)
+        self.assertEqual(layout.column(1), 4)
+        self.assertEqual(layout.column(6), 9)
+        self.assertEqual(layout.column(7), 12)
+        # The tab is shown on all the columns it covers:
+        self.assertEqual(layout.index(0), 0)
+        self.assertEqual(layout.index(3), 0)
+        self.assertEqual(layout.index(4), 1)
+
+    def test_wide(self):
+        # Wide characters, and an e with a combining acute accent:
+        layout = Layout(u'x = u"\u65e5\u672c" # e\u0301\n')
+        self.assertEqual(layout.width, 15)
+        self.assertEqual(layout.column(7), 8)
+        self.assertEqual(layout.column(8), 10)
+        self.assertEqual(layout.index(9), 7)
+        # The accent takes no space:
+        self.assertEqual(layout.column(13), 15)
+        self.assertEqual(layout.column(14), 15)
+        self.assertEqual(layout.index(14), 12)
+
+    def test_segments(self):
+        layout = Layout(u'\tabcdefgh\n', tab_width=4)
+        self.assertEqual(layout.segments(5), [(0, 2), (2, 7), (7, 9)])
+        self.assertEqual(layout.segments(20), [(0, 9)])
+        self.assertEqual(Layout(u'').segments(5), [(0, 0)])
+
+        # Wide characters doesn't get split:
+        layout = Layout(u'a\u65e5\u672c')
+        self.assertEqual(layout.segments(2), [(0, 1), (1, 2), (2, 3)])
+        # Even if they don't fit:
+        self.assertEqual(layout.segments(1), [(0, 1), (1, 2), (2, 3)])
+
+    def test_code(self):
+        f = io.StringIO(u'A text\n\twith several\nlines')
+        c = Code(f, 'text', tab_width=4)
+        layout = c.layout(1)
+        self.assertEqual(layout.width, 16)
+        self.assertIs(c.layout(1), layout)
+
+        # Changing the row or the tab width makes a new layout:
+        c.insert_text(1, 1, u'row ')
+        self.assertEqual(c.layout(1).width, 20)
+        c.tab_width = 8
+        self.assertEqual(c.layout(1).width, 24)
+
+        c.split_row(0, 2, '\n')
+        self.assertEqual(c.layout(1).width, 4)
+        self.assertEqual(c.layout(2).width, 24)
+        self.assertEqual(len(c.layouts), len(c.tokens))
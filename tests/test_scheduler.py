@@ -0,0 +1,107 @@
+# -*- coding: UTF-8 -*-
+import io
+import time
+import unittest
+from doctrine.code import Code
+from doctrine.code import AnalysisScheduler
+from doctrine.code import Analyzer
+
+from tests.test_analysis import PythonTestAnalyzer, TEST_CODE
+
+
+class TestAnalysisScheduler(unittest.TestCase):
+
+    def test_analyze_all(self):
+        f = io.StringIO(TEST_CODE)
+        c = Code(f)
+        s = AnalysisScheduler(PythonTestAnalyzer(c))
+        self.assertFalse(s.done)
+        while s.step():
+            pass
+        self.assertTrue(s.done)
+        self.assertEqual(sum(s.blocks.values()), len(c))
+        # The docstring is one block:
+        self.assertEqual(s.block_at(8), (6, 10))
+        self.assertEqual(s.block_at(16), (16, 1))
+
+    def test_viewport_first(self):
+        f = io.StringIO(TEST_CODE)
+        c = Code(f)
+        s = AnalysisScheduler(PythonTestAnalyzer(c))
+        while s.step():
+            pass
+
+        # Two changes, the one in the viewport is analyzed first:
+        s.edited(30)
+        s.edited(2)
+        s.set_viewport(0, 10)
+        s.step()
+        self.assertEqual(s.block_at(2), (2, 1))
+        self.assertEqual(s.block_at(30), None)
+        s.step()
+        self.assertEqual(s.block_at(30), (30, 1))
+        self.assertTrue(s.done)
+
+    def test_edited(self):
+        f = io.StringIO(TEST_CODE)
+        c = Code(f)
+        s = AnalysisScheduler(PythonTestAnalyzer(c))
+        while s.step():
+            pass
+
+        # Add a multiline string:
+        c.insert(3, '    x = """\n')
+        c.insert(4, '    """\n')
+        s.edited(3, 2)
+        self.assertEqual(s.block_at(3), None)
+        # Blocks after the change are moved:
+        self.assertEqual(s.block_at(19), (19, 1))
+        self.assertEqual(s.block_at(10), (8, 10))
+
+        while s.step():
+            pass
+        self.assertEqual(s.block_at(4), (3, 2))
+        self.assertEqual(s.block_at(5), (5, 1))
+        self.assertEqual(sum(s.blocks.values()), len(c))
+
+        # And remove it again:
+        del c[3]
+        del c[3]
+        s.edited(3, -2)
+        self.assertEqual(s.block_at(8), (6, 10))
+        while s.step():
+            pass
+        self.assertEqual(s.block_at(3), (3, 1))
+        self.assertEqual(sum(s.blocks.values()), len(c))
+
+    def test_thread(self):
+        f = io.StringIO(TEST_CODE)
+        c = Code(f)
+        s = AnalysisScheduler(PythonTestAnalyzer(c))
+        s.start()
+        with s.lock:
+            c[0] = c[0].replace('CodeLayout', 'Layout')
+            s.edited(0)
+        deadline = time.time() + 10
+        while not s.done and time.time() < deadline:
+            time.sleep(0.001)
+        s.stop()
+        self.assertTrue(s.done)
+        self.assertEqual(sum(s.blocks.values()), len(c))
+
+    def test_analyzer_error(self):
+        c = Code(io.StringIO(u'a\nb\n'))
+        s = AnalysisScheduler(Analyzer(c))
+        # Stepping passes the error on, and the block is still pending:
+        self.assertRaises(NotImplementedError, s.step)
+        self.assertFalse(s.done)
+
+        # The worker thread records it, and carries on:
+        s.start()
+        deadline = time.time() + 10
+        while not s.done and time.time() < deadline:
+            time.sleep(0.001)
+        s.stop()
+        self.assertTrue(s.done)
+        self.assertTrue(isinstance(s.error, NotImplementedError))
+        self.assertEqual(s.blocks, {0: 1, 1: 1, 2: 1})